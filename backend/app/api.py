@@ -3,19 +3,32 @@ API Endpoints for Phishing Detection
 Handles URL scanning requests with multi-layered detection
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, HttpUrl
+from fastapi import APIRouter, Body, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, HttpUrl
+import asyncio
+import base64
+import aiohttp
 import joblib
 import os
-from typing import Optional
+import time
+from typing import Annotated, Optional
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
+from cachetools import TTLCache
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Optional: fall back to the joblib model
+    ort = None
 
 from app.feature_extractor import URLFeatureExtractor
 from app.heuristic_engine import HeuristicEngine
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (set LOG_LEVEL=WARNING to silence per-scan messages)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Create router
@@ -33,24 +46,102 @@ elif os.path.exists("../backend/models/phish_model.pkl"):
 else:
     MODEL_PATH = "models/phish_model.pkl"  # Default fallback
 
+# ONNX export written next to the pickle by ml_training/train_model.py
+ONNX_MODEL_PATH = os.path.splitext(MODEL_PATH)[0] + ".onnx"
+
+class ONNXModel:
+    """predict_proba adapter over an ONNX Runtime session of the trained model"""
+    
+    def __init__(self, path: str):
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.n_features_in_ = model_input.shape[1]
+    
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Class probabilities, shape (n_samples, 2)"""
+        # Exported without ZipMap, so outputs are [labels, probabilities]
+        inputs = {self.input_name: features.astype(np.float32, copy=False)}
+        return self.session.run(None, inputs)[1]
+
 model = None
 feature_extractor = URLFeatureExtractor()
 heuristic_engine = HeuristicEngine()
 
+def _onnx_export_is_current() -> bool:
+    """True if the ONNX export exists and is no older than the pickle"""
+    if not os.path.exists(ONNX_MODEL_PATH):
+        return False
+    if os.path.exists(MODEL_PATH) and os.path.getmtime(ONNX_MODEL_PATH) < os.path.getmtime(MODEL_PATH):
+        logger.warning(f"Ignoring {ONNX_MODEL_PATH}: it is older than {MODEL_PATH}")
+        return False
+    return True
+
 try:
-    if os.path.exists(MODEL_PATH):
+    if ort is not None and _onnx_export_is_current():
+        model = ONNXModel(ONNX_MODEL_PATH)
+        logger.info("ML model loaded successfully (ONNX Runtime)")
+    elif os.path.exists(MODEL_PATH):
         model = joblib.load(MODEL_PATH)
         logger.info("ML model loaded successfully")
     else:
         logger.warning(f"Model not found at {MODEL_PATH}. ML detection will be disabled.")
+    
+    # Catch extractor/model drift at boot rather than on the first scan
+    n_features = len(feature_extractor.get_feature_names())
+    if model is not None and model.n_features_in_ != n_features:
+        raise ValueError(
+            f"model expects {model.n_features_in_} features but the extractor "
+            f"produces {n_features}; retrain or run verify_features.py"
+        )
 except Exception as e:
     logger.error(f"Error loading model: {e}")
     model = None
 
+def warm_up() -> None:
+    """
+    Run one throwaway pass through the heuristic and ML layers
+    
+    The first predict_proba call allocates the model's internal buffers and
+    the first heuristic check compiles its regexes; doing both at startup
+    keeps that one-off cost off the first real scan.
+    """
+    start = time.perf_counter()
+    heuristic_engine.check_url("http://example.com/")
+    if model is not None:
+        try:
+            n_features = len(feature_extractor.get_feature_names())
+            model.predict_proba(np.zeros((1, n_features), dtype=np.float32))
+        except Exception as e:
+            logger.warning(f"ML model warmup failed: {e}")
+    logger.info(f"Detection layers warmed up in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+# Browser extensions re-send the same URL on reloads and sub-resource loads,
+# so memoize the heuristic layer and the finished responses (feature values
+# are memoized inside the extractor)
+_SCAN_CACHE = TTLCache(maxsize=4096, ttl=300)
+
+# Threat intelligence verdicts change slowly and the API is rate limited
+VIRUSTOTAL_URL = "https://www.virustotal.com/api/v3/urls"
+_THREAT_INTEL_CACHE = TTLCache(maxsize=4096, ttl=3600)
+
+@lru_cache(maxsize=8192)
+def _check_heuristics(url: str) -> tuple[bool, str, int]:
+    """Cached wrapper around heuristic_engine.check_url"""
+    return heuristic_engine.check_url(url)
+
+# Maximum number of URLs accepted by /scan-urls
+MAX_BATCH_URLS = 100
+
+# Longest URL accepted by /scan-url and per item by /scan-urls
+MAX_URL_LENGTH = 4096
+
 # Request/Response models
-class URLScanRequest(BaseModel):
-    """Request model for URL scanning"""
-    url: str
+class BatchScanRequest(BaseModel):
+    """Request model for scanning several URLs at once"""
+    urls: list[Annotated[str, Field(max_length=MAX_URL_LENGTH)]] = Field(
+        ..., min_length=1, max_length=MAX_BATCH_URLS
+    )
     
 class URLScanResponse(BaseModel):
     """Response model for URL scanning"""
@@ -62,32 +153,59 @@ class URLScanResponse(BaseModel):
     timestamp: str
     details: Optional[dict] = None
 
-async def check_threat_intelligence(url: str) -> tuple[bool, str]:
+async def check_threat_intelligence(
+    url: str, session: Optional[aiohttp.ClientSession]
+) -> tuple[bool, str, bool]:
     """
     Layer 2: Check external threat intelligence APIs
     
-    This is a placeholder for VirusTotal, PhishTank, or similar API integration.
-    In production, you would make actual API calls here.
+    Looks the URL up on VirusTotal when VIRUSTOTAL_API_KEY is set, using the
+    application's shared HTTP session so connections (and their TLS
+    handshakes) are reused across requests. Verdicts are cached per URL.
     
     Args:
         url: The URL to check
+        session: Shared aiohttp session, or None if unavailable
         
     Returns:
-        Tuple of (is_malicious, reason)
-    """
-    # TODO: Implement actual API calls
-    # Example with VirusTotal:
-    # api_key = os.getenv("VIRUSTOTAL_API_KEY")
-    # if api_key:
-    #     response = requests.get(
-    #         f"https://www.virustotal.com/api/v3/urls/{url_id}",
-    #         headers={"x-apikey": api_key}
-    #     )
-    #     ...
-    
-    # Placeholder: Always return safe for now
-    logger.info(f"Threat intelligence check for {url} (placeholder)")
-    return False, "Not found in threat intelligence databases"
+        Tuple of (is_malicious, reason, cacheable); cacheable is False for
+        transient lookup failures, which must not be memoized anywhere
+    """
+    api_key = os.getenv("VIRUSTOTAL_API_KEY")
+    if not api_key or session is None:
+        return False, "Not found in threat intelligence databases", True
+    
+    cached_verdict = _THREAT_INTEL_CACHE.get(url)
+    if cached_verdict is not None:
+        return *cached_verdict, True
+    
+    url_id = base64.urlsafe_b64encode(url.encode()).decode().strip("=")
+    try:
+        async with session.get(
+            f"{VIRUSTOTAL_URL}/{url_id}",
+            headers={"x-apikey": api_key},
+            timeout=aiohttp.ClientTimeout(total=2)
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                stats = data['data']['attributes']['last_analysis_stats']
+                malicious = stats.get('malicious', 0)
+                if malicious > 0:
+                    verdict = (True, f"Flagged by {malicious} vendors on VirusTotal")
+                else:
+                    verdict = (False, "Clean on VirusTotal")
+            elif response.status == 404:
+                verdict = (False, "Not found in threat intelligence databases")
+            else:
+                # Don't cache transient failures (rate limits, outages)
+                logger.warning("VirusTotal lookup failed with HTTP %s", response.status)
+                return False, "Threat intelligence lookup unavailable", False
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+        logger.warning("VirusTotal lookup error: %s", e)
+        return False, "Threat intelligence lookup unavailable", False
+    
+    _THREAT_INTEL_CACHE[url] = verdict
+    return *verdict, True
 
 def calculate_risk_score(heuristic_score: int, ml_probability: float, threat_intel_hit: bool) -> int:
     """
@@ -111,8 +229,149 @@ def calculate_risk_score(heuristic_score: int, ml_probability: float, threat_int
     final_score = int(weighted_heuristic + weighted_ml + weighted_threat)
     return min(100, max(0, final_score))
 
+def _predict(url: str) -> tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Layer 3: ML prediction for one URL (CPU-bound, run off the event loop)
+    
+    Returns:
+        Tuple of (class probabilities or None, error message or None)
+    """
+    if model is None:
+        return None, None
+    try:
+        features = feature_extractor.extract_features_fast(url)
+        return model.predict_proba(features)[0], None
+    except Exception as e:
+        logger.error("ML prediction error: %s", e)
+        return None, str(e)
+
+def _predict_many(urls: list[str]) -> tuple[list, Optional[str]]:
+    """
+    Layer 3: ML prediction for many URLs with a single model call
+    
+    Returns:
+        Tuple of (per-URL class probabilities or Nones, error message or None)
+    """
+    if model is None:
+        return [None] * len(urls), None
+    try:
+        features = feature_extractor.extract_features_matrix(urls)
+        return list(model.predict_proba(features)), None
+    except Exception as e:
+        logger.error("ML prediction error: %s", e)
+        return [None] * len(urls), str(e)
+
+def build_scan_response(
+    url: str,
+    heuristic_result: tuple[bool, str, int],
+    threat_intel_result: tuple[bool, str],
+    ml_probabilities: Optional[np.ndarray],
+    ml_error: Optional[str] = None
+) -> URLScanResponse:
+    """
+    Combine the results of the three detection layers into a response
+    
+    Args:
+        url: The scanned URL
+        heuristic_result: (is_suspicious, reason, score) from the heuristic engine
+        threat_intel_result: (is_malicious, reason) from threat intelligence
+        ml_probabilities: Class probabilities from the ML model, or None
+        ml_error: Error message if the ML prediction failed
+        
+    Returns:
+        URLScanResponse with detection results
+    """
+    # Initialize response data
+    detection_details = {}
+    reasons = []
+    
+    # LAYER 1: Heuristic Analysis
+    is_suspicious_heuristic, heuristic_reason, heuristic_score = heuristic_result
+    
+    detection_details['heuristic'] = {
+        'suspicious': is_suspicious_heuristic,
+        'score': heuristic_score,
+        'reason': heuristic_reason
+    }
+    
+    if is_suspicious_heuristic:
+        reasons.append(f"Heuristic: {heuristic_reason}")
+    
+    # LAYER 2: Threat Intelligence
+    threat_intel_hit, threat_intel_reason = threat_intel_result
+    
+    detection_details['threat_intelligence'] = {
+        'hit': threat_intel_hit,
+        'reason': threat_intel_reason
+    }
+    
+    if threat_intel_hit:
+        reasons.append(f"Threat Intel: {threat_intel_reason}")
+    
+    # LAYER 3: Machine Learning
+    ml_probability = 0.0
+    ml_prediction = 0
+    
+    if ml_probabilities is not None:
+        # The prediction is the more likely class
+        ml_prediction = int(ml_probabilities.argmax())
+        ml_probability = ml_probabilities[1]  # Probability of phishing class
+        
+        detection_details['machine_learning'] = {
+            'prediction': ml_prediction,
+            'probability': float(ml_probability),
+            'confidence': float(max(ml_probabilities))
+        }
+        
+        if ml_prediction == 1:  # Phishing detected
+            reasons.append(f"ML Model: {ml_probability*100:.1f}% confidence of phishing")
+    elif ml_error is not None:
+        detection_details['machine_learning'] = {'error': ml_error}
+    else:
+        detection_details['machine_learning'] = {'status': 'Model not loaded'}
+    
+    # Calculate combined risk score
+    risk_score = calculate_risk_score(heuristic_score, ml_probability, threat_intel_hit)
+    
+    # Determine final status (threshold: 50)
+    is_unsafe = risk_score >= 50
+    status = "unsafe" if is_unsafe else "safe"
+    
+    # Determine primary detection method
+    if threat_intel_hit:
+        detection_method = "Threat Intelligence"
+    elif is_suspicious_heuristic and heuristic_score >= 60:
+        detection_method = "Heuristic Analysis"
+    elif ml_prediction == 1 and ml_probability > 0.7:
+        detection_method = "Machine Learning"
+    elif is_unsafe:
+        detection_method = "Combined Analysis"
+    else:
+        detection_method = "No threats detected"
+    
+    # Compile reason
+    if reasons:
+        final_reason = "; ".join(reasons)
+    else:
+        final_reason = "URL appears safe based on all detection layers"
+    
+    # Create response
+    return URLScanResponse(
+        url=url,
+        status=status,
+        risk_score=risk_score,
+        reason=final_reason,
+        detection_method=detection_method,
+        # Naive UTC ISO string, the format clients already parse
+        timestamp=datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+        details=detection_details
+    )
+
 @router.post("/scan-url", response_model=URLScanResponse)
-async def scan_url(request: URLScanRequest):
+async def scan_url(
+    raw_request: Request,
+    payload: dict = Body(..., examples=[{"url": "https://example.com/login"}])
+):
     """
     Scan a URL for phishing indicators using multi-layered detection
     
@@ -122,126 +381,127 @@ async def scan_url(request: URLScanRequest):
     3. Machine learning model
     
     Args:
-        request: URLScanRequest containing the URL to scan
+        raw_request: The underlying HTTP request (for the shared HTTP session)
+        payload: JSON body of the form {"url": "<url to scan>"}
         
     Returns:
         URLScanResponse with detection results
     """
-    url = request.url
-    logger.info(f"Scanning URL: {url}")
+    # The body is a single string field, so check it by hand rather than
+    # running a Pydantic model's validation on every scan
+    url = payload.get("url")
+    if not isinstance(url, str) or len(url) > MAX_URL_LENGTH:
+        raise HTTPException(
+            status_code=422,
+            detail=f"'url' must be a string of at most {MAX_URL_LENGTH} characters"
+        )
+    
+    http_session = getattr(raw_request.app.state, 'http', None)
+    
+    cached_response = _SCAN_CACHE.get(url)
+    if cached_response is not None:
+        logger.info("Cache hit for URL: %s", url)
+        return cached_response
+    
+    logger.info("Scanning URL: %s", url)
     
     try:
-        # Initialize response data
-        detection_details = {}
-        reasons = []
-        
-        # LAYER 1: Heuristic Analysis
-        logger.info("Layer 1: Running heuristic checks...")
-        is_suspicious_heuristic, heuristic_reason, heuristic_score = heuristic_engine.check_url(url)
-        
-        detection_details['heuristic'] = {
-            'suspicious': is_suspicious_heuristic,
-            'score': heuristic_score,
-            'reason': heuristic_reason
-        }
-        
-        if is_suspicious_heuristic:
-            reasons.append(f"Heuristic: {heuristic_reason}")
-        
-        # LAYER 2: Threat Intelligence
-        logger.info("Layer 2: Checking threat intelligence...")
-        threat_intel_hit, threat_intel_reason = await check_threat_intelligence(url)
-        
-        detection_details['threat_intelligence'] = {
-            'hit': threat_intel_hit,
-            'reason': threat_intel_reason
-        }
+        # Run the layers concurrently: heuristics and ML in worker threads
+        # while the threat intelligence lookup waits on the network
+        logger.info("Running heuristic, threat intelligence and ML layers...")
+        heuristic_result, (*threat_intel_result, cacheable), (ml_probabilities, ml_error) = await asyncio.gather(
+            run_in_threadpool(_check_heuristics, url),
+            check_threat_intelligence(url, http_session),
+            run_in_threadpool(_predict, url)
+        )
         
-        if threat_intel_hit:
-            reasons.append(f"Threat Intel: {threat_intel_reason}")
+        response = build_scan_response(
+            url, heuristic_result, tuple(threat_intel_result), ml_probabilities, ml_error
+        )
         
-        # LAYER 3: Machine Learning
-        ml_probability = 0.0
-        ml_prediction = 0
+        # Responses built on a failed lookup or prediction are retried next time
+        if cacheable and ml_error is None:
+            _SCAN_CACHE[url] = response
         
-        if model is not None:
-            logger.info("Layer 3: Running ML prediction...")
-            try:
-                # Extract features
-                features = feature_extractor.extract_features_vector(url)
-                
-                # Get prediction and probability
-                ml_prediction = model.predict(features)[0]
-                ml_probabilities = model.predict_proba(features)[0]
-                ml_probability = ml_probabilities[1]  # Probability of phishing class
-                
-                detection_details['machine_learning'] = {
-                    'prediction': int(ml_prediction),
-                    'probability': float(ml_probability),
-                    'confidence': float(max(ml_probabilities))
-                }
-                
-                if ml_prediction == 1:  # Phishing detected
-                    reasons.append(f"ML Model: {ml_probability*100:.1f}% confidence of phishing")
-            except Exception as e:
-                logger.error(f"ML prediction error: {e}")
-                detection_details['machine_learning'] = {'error': str(e)}
-        else:
-            detection_details['machine_learning'] = {'status': 'Model not loaded'}
+        logger.info("Scan complete: %s (risk: %d)", response.status, response.risk_score)
+        return response
         
-        # Calculate combined risk score
-        risk_score = calculate_risk_score(heuristic_score, ml_probability, threat_intel_hit)
+    except Exception as e:
+        logger.error("Error scanning URL: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error scanning URL: {str(e)}")
+
+@router.post("/scan-urls", response_model=list[URLScanResponse])
+async def scan_urls(request: BatchScanRequest, raw_request: Request):
+    """
+    Scan several URLs (e.g. every link on a page) in one request
+    
+    Runs the same detection layers as /scan-url, but extracts features
+    for all URLs into one matrix and calls the ML model once.
+    
+    Args:
+        request: BatchScanRequest containing the URLs to scan
+        raw_request: The underlying HTTP request (for the shared HTTP session)
         
-        # Determine final status (threshold: 50)
-        is_unsafe = risk_score >= 50
-        status = "unsafe" if is_unsafe else "safe"
+    Returns:
+        List of URLScanResponse, in the same order as the request
+    """
+    urls = request.urls
+    http_session = getattr(raw_request.app.state, 'http', None)
+    logger.info("Batch scanning %d URLs", len(urls))
+    
+    try:
+        # Repeated URLs within the request are looked up and scanned once
+        unique_urls = list(dict.fromkeys(urls))
+        results = {}
+        for url in unique_urls:
+            cached_response = _SCAN_CACHE.get(url)
+            if cached_response is not None:
+                results[url] = cached_response
         
-        # Determine primary detection method
-        if threat_intel_hit:
-            detection_method = "Threat Intelligence"
-        elif is_suspicious_heuristic and heuristic_score >= 60:
-            detection_method = "Heuristic Analysis"
-        elif ml_prediction == 1 and ml_probability > 0.7:
-            detection_method = "Machine Learning"
-        elif is_unsafe:
-            detection_method = "Combined Analysis"
-        else:
-            detection_method = "No threats detected"
+        pending = [url for url in unique_urls if url not in results]
         
-        # Compile reason
-        if reasons:
-            final_reason = "; ".join(reasons)
-        else:
-            final_reason = "URL appears safe based on all detection layers"
+        if pending:
+            # Heuristics for the whole batch in one worker thread, one
+            # predict_proba for the whole batch in another, and all threat
+            # intelligence lookups in flight at the same time
+            heuristic_results, (ml_probabilities, ml_error), *threat_intel_results = await asyncio.gather(
+                run_in_threadpool(lambda: [_check_heuristics(url) for url in pending]),
+                run_in_threadpool(_predict_many, pending),
+                *(check_threat_intelligence(url, http_session) for url in pending)
+            )
+            
+            for url, heuristic_result, (*threat_intel_result, cacheable), probabilities in zip(
+                pending, heuristic_results, threat_intel_results, ml_probabilities
+            ):
+                response = build_scan_response(
+                    url, heuristic_result, tuple(threat_intel_result), probabilities, ml_error
+                )
+                # Responses built on a failed lookup or prediction are retried next time
+                if cacheable and ml_error is None:
+                    _SCAN_CACHE[url] = response
+                results[url] = response
         
-        # Create response
-        response = URLScanResponse(
-            url=url,
-            status=status,
-            risk_score=risk_score,
-            reason=final_reason,
-            detection_method=detection_method,
-            timestamp=datetime.utcnow().isoformat(),
-            details=detection_details
+        logger.info(
+            "Batch scan complete: %d scanned, %d cached, %d duplicates",
+            len(pending), len(results) - len(pending), len(urls) - len(unique_urls)
         )
-        
-        logger.info(f"Scan complete: {status} (risk: {risk_score})")
-        return response
+        return [results[url] for url in urls]
         
     except Exception as e:
-        logger.error(f"Error scanning URL: {e}")
-        raise HTTPException(status_code=500, detail=f"Error scanning URL: {str(e)}")
+        logger.error("Error scanning URLs: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error scanning URLs: {str(e)}")
 
 @router.get("/stats")
 async def get_stats():
     """Get API statistics and model information"""
     return {
         "model_loaded": model is not None,
-        "model_path": MODEL_PATH,
+        "model_path": ONNX_MODEL_PATH if isinstance(model, ONNXModel) else MODEL_PATH,
         "available_features": feature_extractor.get_feature_names(),
         "detection_layers": [
             "Heuristic Analysis",
-            "Threat Intelligence (Placeholder)",
+            "Threat Intelligence (VirusTotal)" if os.getenv("VIRUSTOTAL_API_KEY")
+            else "Threat Intelligence (Placeholder)",
             "Machine Learning" if model else "Machine Learning (Disabled)"
         ]
     }
\ No newline at end of file
@@ -5,8 +5,11 @@ Uses regex patterns and typosquatting detection to identify suspicious URLs
 
 import re
 from urllib.parse import urlparse
+from collections import defaultdict
 from typing import Tuple, Optional
-import difflib
+from rapidfuzz import fuzz, process
+
+from app.patterns import IPV4_RE
 
 class HeuristicEngine:
     """Pattern-based phishing detection using heuristics"""
@@ -23,6 +26,27 @@ class HeuristicEngine:
             'github.com', 'dropbox.com', 'yahoo.com', 'outlook.com'
         }
         
+        # Legitimate domains bucketed by the domain lengths that can still be
+        # more than 80% similar to them (the length gap must stay under half
+        # the shorter length), so most URLs are compared against few or none
+        self._legit_by_len = {}
+        max_len = max(len(d) for d in self.legitimate_domains)
+        for length in range(1, 2 * max_len):
+            candidates = [
+                d for d in sorted(self.legitimate_domains)
+                if 2 * abs(len(d) - length) < min(len(d), length)
+            ]
+            if candidates:
+                self._legit_by_len[length] = candidates
+        
+        # Character bigram -> legitimate domains containing it. Each edit
+        # destroys at most two bigrams, so at the 80% cutoff every match
+        # for these domain lengths shares at least one bigram with the query.
+        self._bigram_index = defaultdict(set)
+        for d in self.legitimate_domains:
+            for i in range(len(d) - 1):
+                self._bigram_index[d[i:i + 2]].add(d)
+        
         # Suspicious keywords often found in phishing URLs
         self.suspicious_keywords = [
             'verify', 'account', 'update', 'secure', 'banking',
@@ -31,11 +55,25 @@ class HeuristicEngine:
             'limited', 'unusual', 'activity', 'security-check'
         ]
         
-        # Suspicious TLDs commonly used in phishing
-        self.suspicious_tlds = [
-            '.tk', '.ml', '.ga', '.cf', '.gq', '.pw', '.cc',
-            '.top', '.xyz', '.club', '.work', '.click'
-        ]
+        # All keywords in one pattern so a URL is scanned once. The lookahead
+        # reports the longest keyword starting at each position without
+        # consuming it, so overlapping keywords are all found; shorter
+        # keywords contained in a match are implied by it.
+        keywords = sorted(self.suspicious_keywords, key=len, reverse=True)
+        self._keyword_re = re.compile(
+            '(?=(' + '|'.join(re.escape(k) for k in keywords) + '))'
+        )
+        self._keywords_in = {
+            k: frozenset(other for other in keywords if other in k)
+            for k in keywords
+        }
+        
+        # Suspicious TLDs commonly used in phishing (matched against the
+        # hostname's last label)
+        self.suspicious_tlds = {
+            'tk', 'ml', 'ga', 'cf', 'gq', 'pw', 'cc',
+            'top', 'xyz', 'club', 'work', 'click'
+        }
         
         # Character substitutions commonly used in typosquatting
         self.char_substitutions = {
@@ -58,19 +96,22 @@ class HeuristicEngine:
         confidence = 0
         reasons = []
         
+        # Parse once; the hostname is shared by the structural checks below
+        hostname = self._extract_hostname(url)
+        
         # Check 1: IP address in URL
         if self._has_ip_address(url):
             confidence += 30
             reasons.append("Contains IP address instead of domain name")
         
         # Check 2: Excessive subdomains
-        subdomain_count = self._count_subdomains(url)
+        subdomain_count = self._count_subdomains(hostname)
         if subdomain_count >= 3:
             confidence += 20
             reasons.append(f"Suspicious number of subdomains ({subdomain_count})")
         
         # Check 3: Typosquatting detection
-        typo_result = self._check_typosquatting(url)
+        typo_result = self._check_typosquatting(hostname)
         if typo_result:
             confidence += 40
             reasons.append(f"Possible typosquatting of {typo_result}")
@@ -85,7 +126,7 @@ class HeuristicEngine:
             reasons.append("Contains suspicious keyword")
         
         # Check 5: Suspicious TLD
-        if self._has_suspicious_tld(url):
+        if self._has_suspicious_tld(hostname):
             confidence += 15
             reasons.append("Uses suspicious top-level domain")
         
@@ -106,7 +147,7 @@ class HeuristicEngine:
             reasons.append("Unusually long URL")
         
         # Check 9: Homograph attack (Unicode lookalikes)
-        if self._check_homograph(url):
+        if self._check_homograph(url, hostname):
             confidence += 30
             reasons.append("Possible homograph attack (lookalike characters)")
         
@@ -121,21 +162,23 @@ class HeuristicEngine:
     
     def _has_ip_address(self, url: str) -> bool:
         """Check if URL contains an IP address"""
-        ip_pattern = r'(?:http[s]?://)?(\d{1,3}\.){3}\d{1,3}'
-        return bool(re.search(ip_pattern, url))
+        return IPV4_RE.search(url) is not None
     
-    def _count_subdomains(self, url: str) -> int:
-        """Count number of subdomains in URL"""
+    def _extract_hostname(self, url: str) -> str:
+        """Parse the URL once and return its hostname ('' if unparseable)"""
         try:
             parsed = urlparse(url if url.startswith('http') else 'http://' + url)
-            hostname = parsed.hostname or ''
-            parts = hostname.split('.')
-            # Subtract 2 for domain and TLD
-            return max(0, len(parts) - 2)
+            return parsed.hostname or ''
         except:
-            return 0
+            return ''
+    
+    def _count_subdomains(self, hostname: str) -> int:
+        """Count number of subdomains in hostname"""
+        parts = hostname.split('.')
+        # Subtract 2 for domain and TLD
+        return max(0, len(parts) - 2)
     
-    def _check_typosquatting(self, url: str) -> Optional[str]:
+    def _check_typosquatting(self, hostname: str) -> Optional[str]:
         """
         Check for typosquatting against known legitimate domains
         
@@ -143,9 +186,6 @@ class HeuristicEngine:
             The legitimate domain being impersonated, or None
         """
         try:
-            parsed = urlparse(url if url.startswith('http') else 'http://' + url)
-            hostname = parsed.hostname or ''
-            
             # Extract domain without subdomains
             parts = hostname.split('.')
             if len(parts) >= 2:
@@ -165,11 +205,22 @@ class HeuristicEngine:
             if normalized in self.legitimate_domains:
                 return normalized
             
-            # Check for similarity to legitimate domains
-            for legit_domain in self.legitimate_domains:
-                similarity = difflib.SequenceMatcher(None, domain, legit_domain).ratio()
-                if similarity > 0.8:  # 80% similar
-                    return legit_domain
+            # Check for similarity to legitimate domains of a plausible length
+            candidates = self._legit_by_len.get(len(domain))
+            if not candidates:
+                return None
+            
+            sharing = set().union(*(
+                self._bigram_index.get(domain[i:i + 2], ())
+                for i in range(len(domain) - 1)
+            ))
+            candidates = [d for d in candidates if d in sharing]
+            if not candidates:
+                return None
+            
+            match = process.extractOne(domain, candidates, scorer=fuzz.ratio, score_cutoff=80)
+            if match and match[1] > 80:  # 80% similar
+                return match[0]
             
             return None
         except:
@@ -177,20 +228,19 @@ class HeuristicEngine:
     
     def _count_suspicious_keywords(self, url: str) -> int:
         """Count suspicious keywords in URL"""
-        count = 0
-        for keyword in self.suspicious_keywords:
-            if keyword in url:
-                count += 1
-        return count
+        found = set()
+        for match in self._keyword_re.finditer(url):
+            found |= self._keywords_in[match.group(1)]
+        return len(found)
     
-    def _has_suspicious_tld(self, url: str) -> bool:
-        """Check if URL uses a suspicious TLD"""
-        for tld in self.suspicious_tlds:
-            if url.endswith(tld) or tld + '/' in url:
-                return True
-        return False
+    def _has_suspicious_tld(self, hostname: str) -> bool:
+        """Check if the hostname uses a suspicious TLD"""
+        # Ignore a trailing root dot ('example.tk.'); single-label hosts
+        # such as 'http://work/' have no TLD
+        _, dot, tld = hostname.rstrip('.').rpartition('.')
+        return bool(dot) and tld in self.suspicious_tlds
     
-    def _check_homograph(self, url: str) -> bool:
+    def _check_homograph(self, url: str, hostname: str) -> bool:
         """Check for homograph attacks (simplified)"""
         # Check for mix of different scripts or suspicious Unicode characters
         # This is a simplified check - production systems would be more sophisticated
@@ -201,9 +251,6 @@ class HeuristicEngine:
         except UnicodeEncodeError:
             # Contains non-ASCII characters
             # Check if it's a legitimate internationalized domain or suspicious
-            parsed = urlparse(url if url.startswith('http') else 'http://' + url)
-            hostname = parsed.hostname or ''
-            
             # If hostname contains non-ASCII in suspicious context, flag it
             if any(ord(c) > 127 for c in hostname):
                 return True
@@ -3,16 +3,41 @@ FastAPI Application Entry Point
 Main application setup with middleware and configuration
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import aiohttp
+import anyio
+import os
 import uvicorn
-from app.api import router
+from app.api import router, warm_up
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Prepare the detection layers and shared resources, then clean up on exit"""
+    # Starlette's default of 40 threads caps how many scans run in parallel
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("THREADPOOL_SIZE", "64"))
+    
+    # Pay the model's and heuristics' first-call costs before serving scans
+    warm_up()
+    
+    # One pooled session for threat intelligence lookups keeps connections
+    # alive across scans
+    app.state.http = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.close()
 
 # Create FastAPI application
 app = FastAPI(
     title="Phish-Shield API",
     description="Multi-layered phishing detection system API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS to allow browser extension to communicate
@@ -46,11 +71,20 @@ async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
-    # Run the application
+    # RELOAD=1 for development (auto-reload forces a single worker);
+    # otherwise run WORKERS processes, one per CPU core by default
+    reload = os.getenv("RELOAD", "").lower() in ("1", "true", "yes")
+    workers = 1 if reload else int(os.getenv("WORKERS", os.cpu_count() or 1))
+    
+    # Run the application ("auto" picks uvloop and httptools, installed by
+    # uvicorn[standard], and falls back to asyncio/h11 where unavailable)
     uvicorn.run(
-        "main:app",
+        "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,  # Auto-reload on code changes (development only)
+        loop="auto",
+        http="auto",
+        reload=reload,
+        workers=workers,
         log_level="info"
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,9 @@
+"""
+Shared Regex Patterns
+Compiled once and used by both the feature extractor and the heuristic engine
+"""
+
+import re
+
+# Dotted-quad IPv4 address anywhere in a URL (ASCII digits only)
+IPV4_RE = re.compile(r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}')
@@ -5,11 +5,22 @@ Run this after updating feature_extractor.py
 
 import sys
 import os
+from functools import lru_cache
 sys.path.append('backend')
 
 from app.feature_extractor import URLFeatureExtractor
 import joblib
 
+@lru_cache(maxsize=1)
+def _load_model(path: str):
+    """Load the trained model once per process"""
+    return joblib.load(path)
+
+@lru_cache(maxsize=1)
+def _get_extractor() -> URLFeatureExtractor:
+    """Create the feature extractor once per process"""
+    return URLFeatureExtractor()
+
 def verify_features():
     """Check feature compatibility"""
     
@@ -18,7 +29,7 @@ def verify_features():
     print("=" * 70)
     
     # Initialize extractor
-    extractor = URLFeatureExtractor()
+    extractor = _get_extractor()
     
     # Check model exists
     model_path = "models/phish_model.pkl"
@@ -32,7 +43,7 @@ def verify_features():
     
     # Load model
     print("\nLoading model...")
-    model = joblib.load(model_path)
+    model = _load_model(model_path)
     
     # Get expected features from model
     expected_features = model.n_features_in_
@@ -69,8 +80,10 @@ def verify_features():
     # Show feature list
     print("\nFeature List:")
     print("-" * 70)
-    for i, (name, value) in enumerate(features.items(), 1):
-        print(f"  {i:2}. {name:<20} = {value}")
+    print("\n".join(
+        f"  {i:2}. {name:<20} = {value}"
+        for i, (name, value) in enumerate(features.items(), 1)
+    ))
     
     # Test prediction
     print("\n" + "=" * 70)
@@ -110,12 +123,19 @@ def verify_features():
     print("-" * 80)
     
     all_passed = True
-    for url, expected in test_urls:
-        try:
-            features_vector = extractor.extract_features_vector(url)
-            prediction = model.predict(features_vector)[0]
-            prob = model.predict_proba(features_vector)[0][1]
-            
+    try:
+        # One model call for all test URLs; predict() is the argmax of
+        # predict_proba(), so derive it instead of a second pass
+        features_matrix = extractor.extract_features_matrix([url for url, _ in test_urls])
+        probabilities = model.predict_proba(features_matrix)
+        predictions = model.classes_[probabilities.argmax(axis=1)]
+    except Exception as e:
+        for url, expected in test_urls:
+            print(f"{url:<40} {expected:<12} ERROR        -      ❌")
+        print(f"  Error: {e}")
+        all_passed = False
+    else:
+        for (url, expected), prediction, prob in zip(test_urls, predictions, probabilities[:, 1]):
             predicted = "Phishing" if prediction == 1 else "Safe"
             status = "✅" if predicted == expected else "⚠️"
             
@@ -123,11 +143,6 @@ def verify_features():
             
             if predicted != expected:
                 all_passed = False
-                
-        except Exception as e:
-            print(f"{url:<40} {expected:<12} ERROR        -      ❌")
-            print(f"  Error: {e}")
-            all_passed = False
     
     print("\n" + "=" * 70)
     print("SUMMARY")
@@ -3,9 +3,22 @@ Prepare Kaggle Phishing Dataset
 Works with multiple Kaggle dataset formats
 """
 
+import re
+import numpy as np
 import pandas as pd
 import os
 
+# Column names containing any of these are taken as the URL/label columns
+URL_COLUMN_RE = re.compile(r'url|link|website|domain|site|address', re.IGNORECASE)
+LABEL_COLUMN_RE = re.compile(r'label|class|type|status|target|category|result', re.IGNORECASE)
+
+# Text label -> class (0 = legitimate, 1 = phishing)
+LABEL_MAP = {
+    'legitimate': 0, 'legit': 0, 'good': 0, 'safe': 0, 'benign': 0, 'normal': 0,
+    'phishing': 1, 'phish': 1, 'bad': 1, 'malicious': 1, 'fraud': 1, 'suspicious': 1,
+    '0': 0, '1': 1, 'false': 0, 'true': 1, 'no': 0, 'yes': 1
+}
+
 def prepare_kaggle_dataset():
     """Prepare Kaggle dataset for training"""
     
@@ -13,20 +26,25 @@ def prepare_kaggle_dataset():
     print("PREPARING KAGGLE PHISHING DATASET")
     print("=" * 70)
     
-    # Look for downloaded Kaggle files
+    # Look for downloaded Kaggle files (in order of preference), listing
+    # the download directory once instead of probing each name
+    download_dir = "ml_training/datasets"
     possible_files = [
-        "ml_training/datasets/dataset_full.csv",
-        "ml_training/datasets/phishing_site_urls.csv",
-        "ml_training/datasets/phishing.csv",
-        "ml_training/datasets/dataset_phishing.csv",
-        "ml_training/datasets/web-page-phishing.csv",
+        "dataset_full.csv",
+        "phishing_site_urls.csv",
+        "phishing.csv",
+        "dataset_phishing.csv",
+        "web-page-phishing.csv",
     ]
     
-    dataset_path = None
-    for path in possible_files:
-        if os.path.exists(path):
-            dataset_path = path
-            break
+    dir_entries = os.listdir(download_dir) if os.path.isdir(download_dir) else []
+    # Match case-insensitively, like the os.path.exists probes on Windows
+    entries_by_name = {entry.casefold(): entry for entry in dir_entries}
+    dataset_path = next(
+        (os.path.join(download_dir, entries_by_name[name.casefold()])
+         for name in possible_files if name.casefold() in entries_by_name),
+        None
+    )
     
     if dataset_path is None:
         print("❌ Kaggle dataset not found!")
@@ -71,15 +89,15 @@ def prepare_kaggle_dataset():
     
     print(f"\n✓ Found dataset at: {dataset_path}\n")
     
-    # Load dataset
+    # Read just the header and a few rows to detect columns; the full file
+    # is loaded below with only the URL and label columns
     print("Loading dataset...")
     try:
-        df = pd.read_csv(dataset_path)
+        df = pd.read_csv(dataset_path, nrows=5)
     except Exception as e:
         print(f"❌ Error loading CSV: {e}")
         return False
     
-    print(f"✓ Loaded {len(df):,} rows")
     print(f"✓ Columns: {list(df.columns)}\n")
     
     # Show sample
@@ -87,23 +105,9 @@ def prepare_kaggle_dataset():
     print(df.head())
     print()
     
-    # Detect columns
-    url_col = None
-    label_col = None
-    
-    # Common URL column names
-    url_keywords = ['url', 'urls', 'link', 'website', 'domain', 'site', 'address']
-    for col in df.columns:
-        if any(keyword in col.lower() for keyword in url_keywords):
-            url_col = col
-            break
-    
-    # Common label column names
-    label_keywords = ['label', 'class', 'type', 'status', 'target', 'category', 'result']
-    for col in df.columns:
-        if any(keyword in col.lower() for keyword in label_keywords):
-            label_col = col
-            break
+    # Detect columns: first column matching the common URL / label column names
+    url_col = next((col for col in df.columns if URL_COLUMN_RE.search(col)), None)
+    label_col = next((col for col in df.columns if LABEL_COLUMN_RE.search(col)), None)
     
     # Manual input if not found
     if url_col is None or label_col is None:
@@ -119,16 +123,25 @@ def prepare_kaggle_dataset():
     print(f"  URL column: '{url_col}'")
     print(f"  Label column: '{label_col}'\n")
     
-    # Create clean dataframe
+    for col in (url_col, label_col):
+        if col not in df.columns:
+            print(f"❌ Error: {col!r}")
+            return False
+    
+    # Load the full dataset, parsing only the two columns we keep
+    # (pyarrow's multithreaded reader skips the others entirely)
     try:
-        clean_df = pd.DataFrame({
-            'url': df[url_col],
-            'label': df[label_col]
-        })
-    except KeyError as e:
-        print(f"❌ Error: {e}")
+        df = pd.read_csv(dataset_path, engine="pyarrow", usecols=[url_col, label_col])
+    except Exception as e:
+        print(f"❌ Error loading CSV: {e}")
         return False
     
+    print(f"✓ Loaded {len(df):,} rows\n")
+    
+    # Create clean dataframe (url, label order; the selection is a copy of just
+    # the two columns usecols already limited the read to)
+    clean_df = df[[url_col, label_col]].set_axis(['url', 'label'], axis=1)
+    
     # Clean data
     print("Cleaning data...")
     original_size = len(clean_df)
@@ -140,28 +153,27 @@ def prepare_kaggle_dataset():
     unique_labels = clean_df['label'].unique()
     print(f"Unique labels found: {unique_labels}")
     
-    # Convert labels to 0/1
+    # Convert labels to 0/1 (-1 marks invalid labels)
     if clean_df['label'].dtype == 'object':
-        # Map text labels
-        label_map = {}
-        
-        # Common mappings
-        common_maps = {
-            'legitimate': 0, 'legit': 0, 'good': 0, 'safe': 0, 'benign': 0, 'normal': 0,
-            'phishing': 1, 'phish': 1, 'bad': 1, 'malicious': 1, 'fraud': 1, 'suspicious': 1,
-            '0': 0, '1': 1, 'false': 0, 'true': 1, 'no': 0, 'yes': 1
-        }
-        
-        clean_df['label'] = clean_df['label'].astype(str).str.lower().str.strip()
-        clean_df['label'] = clean_df['label'].map(common_maps)
-    
-    # Convert to numeric
-    clean_df['label'] = pd.to_numeric(clean_df['label'], errors='coerce')
+        # Map text labels: normalize and look up each distinct label once,
+        # then expand to rows by indexing with the factorized codes
+        codes, uniques = pd.factorize(clean_df['label'])
+        lookup = np.array(
+            [LABEL_MAP.get(str(value).lower().strip(), -1) for value in uniques],
+            dtype=np.int8
+        )
+        clean_df['label'] = lookup[codes]
+    else:
+        # Numeric labels: anything other than 0/1 is invalid. Columns that
+        # are already numeric (NaNs were dropped above) skip the re-parse
+        labels = clean_df['label']
+        if not pd.api.types.is_numeric_dtype(labels):
+            labels = pd.to_numeric(labels, errors='coerce').fillna(-1)
+        labels = labels.to_numpy(dtype=np.int64)
+        clean_df['label'] = np.where((labels == 0) | (labels == 1), labels, -1).astype(np.int8)
     
     # Remove invalid labels
-    clean_df = clean_df.dropna(subset=['label'])
-    clean_df['label'] = clean_df['label'].astype(int)
-    clean_df = clean_df[clean_df['label'].isin([0, 1])]
+    clean_df = clean_df[clean_df['label'] != -1]
     
     # Remove duplicates
     clean_df = clean_df.drop_duplicates(subset=['url'])
@@ -174,10 +186,12 @@ def prepare_kaggle_dataset():
     print("CLASS DISTRIBUTION")
     print("=" * 70)
     
-    counts = clean_df['label'].value_counts().sort_index()
-    print(f"\nLegitimate (0): {counts[0]:>8,} URLs ({counts[0]/len(clean_df)*100:.2f}%)")
-    print(f"Phishing (1):   {counts[1]:>8,} URLs ({counts[1]/len(clean_df)*100:.2f}%)")
-    print(f"Total:          {len(clean_df):>8,} URLs")
+    counts = np.bincount(clean_df['label'].to_numpy(), minlength=2)
+    print("\n".join([
+        f"\nLegitimate (0): {counts[0]:>8,} URLs ({counts[0]/len(clean_df)*100:.2f}%)",
+        f"Phishing (1):   {counts[1]:>8,} URLs ({counts[1]/len(clean_df)*100:.2f}%)",
+        f"Total:          {len(clean_df):>8,} URLs",
+    ]))
     
     # Balance check
     balance_ratio = min(counts[0], counts[1]) / max(counts[0], counts[1])
@@ -197,12 +211,21 @@ def prepare_kaggle_dataset():
     print(f"\n✓ Saved to: {output_path}")
     print(f"✓ File size: {os.path.getsize(output_path) / (1024*1024):.2f} MB")
     
+    # Typed columnar copy, preferred by train_model.py (much faster to load)
+    parquet_path = os.path.splitext(output_path)[0] + ".parquet"
+    clean_df.to_parquet(parquet_path, engine="pyarrow", compression="snappy", index=False)
+    
+    print(f"✓ Saved to: {parquet_path}")
+    print(f"✓ File size: {os.path.getsize(parquet_path) / (1024*1024):.2f} MB")
+    
     # Sample
     print("\nSample URLs:")
     print("-" * 70)
-    for _, row in clean_df.sample(min(10, len(clean_df))).iterrows():
-        label = "PHISHING  " if row['label'] == 1 else "LEGITIMATE"
-        print(f"[{label}] {row['url'][:60]}")
+    sample_idx = np.random.default_rng().choice(len(clean_df), size=min(10, len(clean_df)), replace=False)
+    print("\n".join(
+        f"[{'PHISHING  ' if label == 1 else 'LEGITIMATE'}] {url[:60]}"
+        for url, label in zip(clean_df['url'].to_numpy()[sample_idx], clean_df['label'].to_numpy()[sample_idx])
+    ))
     
     print("\n" + "=" * 70)
     print("✅ DATASET READY!")
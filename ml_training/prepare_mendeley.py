@@ -3,9 +3,22 @@ Mendeley Dataset Preparation Script
 Converts the Mendeley Phishing Dataset into the format required for training
 """
 
+import re
+import numpy as np
 import pandas as pd
 import os
 
+# Column names containing any of these are taken as the URL/label columns
+URL_COLUMN_RE = re.compile(r'url|link|website|domain|site', re.IGNORECASE)
+LABEL_COLUMN_RE = re.compile(r'label|class|type|status|target|category', re.IGNORECASE)
+
+# Text label -> class (0 = legitimate, 1 = phishing), matched case-insensitively
+LABEL_MAP = {
+    'legitimate': 0, 'legit': 0, 'good': 0, 'safe': 0, 'benign': 0,
+    'phishing': 1, 'phish': 1, 'bad': 1, 'malicious': 1, 'fraud': 1,
+    '0': 0, '1': 1, 'normal': 0, 'abnormal': 1
+}
+
 def prepare_mendeley_dataset():
     """Prepare Mendeley dataset for training"""
     
@@ -16,24 +29,29 @@ def prepare_mendeley_dataset():
     print("Size: ~248,000 URLs")
     print("Published: March 2024\n")
     
-    # Look for downloaded file in common locations
-    possible_paths = [
-        "ml_training/datasets/phishing_dataset_raw.csv",
-        "ml_training/datasets/Phishing_Legitimate_full.csv",
-        "ml_training/datasets/phishing_urls.csv",
-        "ml_training/datasets/mendeley_phishing.csv",
+    # Look for downloaded file in common locations (in order of preference)
+    dataset_dir = "ml_training/datasets"
+    possible_names = [
+        "phishing_dataset_raw.csv",
+        "Phishing_Legitimate_full.csv",
+        "phishing_urls.csv",
+        "mendeley_phishing.csv",
     ]
     
-    download_path = None
-    for path in possible_paths:
-        if os.path.exists(path):
-            download_path = path
-            break
+    # List the directory once; both the lookup and the fallback menu use it
+    dir_entries = os.listdir(dataset_dir) if os.path.isdir(dataset_dir) else []
+    # Match case-insensitively, like the os.path.exists probes on Windows
+    entries_by_name = {entry.casefold(): entry for entry in dir_entries}
+    download_path = next(
+        (os.path.join(dataset_dir, entries_by_name[name.casefold()])
+         for name in possible_names if name.casefold() in entries_by_name),
+        None
+    )
     
     if download_path is None:
         print("❌ Dataset not found in expected locations:")
-        for path in possible_paths:
-            print(f"   - {path}")
+        for name in possible_names:
+            print(f"   - {dataset_dir}/{name}")
         
         print("\n📥 DOWNLOAD INSTRUCTIONS:")
         print("-" * 70)
@@ -47,9 +65,8 @@ def prepare_mendeley_dataset():
         print("-" * 70)
         
         # Check if there are any CSV files in the directory
-        dataset_dir = "ml_training/datasets"
-        if os.path.exists(dataset_dir):
-            csv_files = [f for f in os.listdir(dataset_dir) if f.endswith('.csv')]
+        if os.path.isdir(dataset_dir):
+            csv_files = [f for f in dir_entries if f.endswith('.csv')]
             if csv_files:
                 print(f"\nFound these CSV files in {dataset_dir}:")
                 for i, f in enumerate(csv_files, 1):
@@ -75,36 +92,27 @@ def prepare_mendeley_dataset():
     # Output path
     output_path = "ml_training/datasets/phishing_urls.csv"
     
-    # Load dataset
+    # Read just the header and a few rows to detect columns; the full file
+    # is loaded below with only the URL and label columns
     print("Loading dataset...")
     try:
-        df = pd.read_csv(download_path)
+        df = pd.read_csv(download_path, nrows=5)
     except Exception as e:
         print(f"❌ Error loading CSV: {e}")
         return False
     
-    print(f"✓ Loaded {len(df):,} rows")
     print(f"✓ Columns: {list(df.columns)}\n")
     
     # Identify URL and label columns
-    url_col = None
-    label_col = None
-    
     # Find URL column (case-insensitive)
-    url_keywords = ['url', 'urls', 'link', 'website', 'domain', 'site']
-    for col in df.columns:
-        if any(keyword in col.lower() for keyword in url_keywords):
-            url_col = col
-            print(f"✓ Detected URL column: '{url_col}'")
-            break
+    url_col = next((col for col in df.columns if URL_COLUMN_RE.search(col)), None)
+    if url_col is not None:
+        print(f"✓ Detected URL column: '{url_col}'")
     
     # Find label column (case-insensitive)
-    label_keywords = ['label', 'class', 'type', 'status', 'target', 'category']
-    for col in df.columns:
-        if any(keyword in col.lower() for keyword in label_keywords):
-            label_col = col
-            print(f"✓ Detected label column: '{label_col}'")
-            break
+    label_col = next((col for col in df.columns if LABEL_COLUMN_RE.search(col)), None)
+    if label_col is not None:
+        print(f"✓ Detected label column: '{label_col}'")
     
     # Manual selection if auto-detection fails
     if url_col is None or label_col is None:
@@ -123,17 +131,26 @@ def prepare_mendeley_dataset():
     print(f"  URL: '{url_col}'")
     print(f"  Label: '{label_col}'\n")
     
-    # Create clean dataframe
+    for col in (url_col, label_col):
+        if col not in df.columns:
+            print(f"❌ Error: Column not found - {col!r}")
+            print(f"Available columns: {list(df.columns)}")
+            return False
+    
+    # Load the full dataset, parsing only the two columns we keep
+    # (pyarrow's multithreaded reader skips the others entirely)
     try:
-        clean_df = pd.DataFrame({
-            'url': df[url_col],
-            'label': df[label_col]
-        })
-    except KeyError as e:
-        print(f"❌ Error: Column not found - {e}")
-        print(f"Available columns: {list(df.columns)}")
+        df = pd.read_csv(download_path, engine="pyarrow", usecols=[url_col, label_col])
+    except Exception as e:
+        print(f"❌ Error loading CSV: {e}")
         return False
     
+    print(f"✓ Loaded {len(df):,} rows\n")
+    
+    # Create clean dataframe (url, label order; the selection is a copy of just
+    # the two columns usecols already limited the read to)
+    clean_df = df[[url_col, label_col]].set_axis(['url', 'label'], axis=1)
+    
     # Show sample before cleaning
     print("Sample of original data:")
     print(clean_df.head(10))
@@ -152,30 +169,29 @@ def prepare_mendeley_dataset():
     print(f"Original label type: {clean_df['label'].dtype}")
     print(f"Unique values: {clean_df['label'].unique()[:10]}")  # Show first 10
     
-    # Convert any text labels to numeric
+    # Convert labels to 0/1 (-1 marks labels that can't be converted)
     if clean_df['label'].dtype == 'object' or clean_df['label'].dtype == 'str':
         print("Converting text labels to numeric...")
         
-        # Map common label formats (case-insensitive)
-        label_map = {
-            'legitimate': 0, 'legit': 0, 'good': 0, 'safe': 0, 'benign': 0,
-            'phishing': 1, 'phish': 1, 'bad': 1, 'malicious': 1, 'fraud': 1,
-            '0': 0, '1': 1, 'normal': 0, 'abnormal': 1
-        }
-        
-        clean_df['label'] = clean_df['label'].astype(str).str.lower().str.strip()
-        clean_df['label'] = clean_df['label'].map(label_map)
-    
-    # Convert to int
-    clean_df['label'] = pd.to_numeric(clean_df['label'], errors='coerce')
-    
-    # Remove any rows where label couldn't be converted
-    before_filter = len(clean_df)
-    clean_df = clean_df.dropna(subset=['label'])
-    clean_df['label'] = clean_df['label'].astype(int)
+        # Normalize and look up each distinct label once, then expand to
+        # rows by indexing with the factorized codes
+        codes, uniques = pd.factorize(clean_df['label'])
+        lookup = np.array(
+            [LABEL_MAP.get(str(value).lower().strip(), -1) for value in uniques],
+            dtype=np.int8
+        )
+        clean_df['label'] = lookup[codes]
+    else:
+        # Already-numeric labels (NaNs were dropped above) skip the re-parse
+        labels = clean_df['label']
+        if not pd.api.types.is_numeric_dtype(labels):
+            labels = pd.to_numeric(labels, errors='coerce').fillna(-1)
+        labels = labels.to_numpy(dtype=np.int64)
+        clean_df['label'] = np.where((labels == 0) | (labels == 1), labels, -1).astype(np.int8)
     
     # Keep only 0 and 1 labels
-    clean_df = clean_df[clean_df['label'].isin([0, 1])]
+    before_filter = len(clean_df)
+    clean_df = clean_df[clean_df['label'] != -1]
     
     removed = before_filter - len(clean_df)
     if removed > 0:
@@ -196,10 +212,12 @@ def prepare_mendeley_dataset():
     print("CLASS DISTRIBUTION")
     print("=" * 70)
     
-    counts = clean_df['label'].value_counts().sort_index()
-    print(f"\nLegitimate (0): {counts[0]:>8,} URLs ({counts[0]/len(clean_df)*100:.2f}%)")
-    print(f"Phishing (1):   {counts[1]:>8,} URLs ({counts[1]/len(clean_df)*100:.2f}%)")
-    print(f"Total:          {len(clean_df):>8,} URLs")
+    counts = np.bincount(clean_df['label'].to_numpy(), minlength=2)
+    print("\n".join([
+        f"\nLegitimate (0): {counts[0]:>8,} URLs ({counts[0]/len(clean_df)*100:.2f}%)",
+        f"Phishing (1):   {counts[1]:>8,} URLs ({counts[1]/len(clean_df)*100:.2f}%)",
+        f"Total:          {len(clean_df):>8,} URLs",
+    ]))
     
     # Check balance
     balance_ratio = min(counts[0], counts[1]) / max(counts[0], counts[1])
@@ -223,13 +241,20 @@ def prepare_mendeley_dataset():
     file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
     print(f"✓ File size: {file_size:.2f} MB")
     
+    # Typed columnar copy, preferred by train_model.py (much faster to load)
+    parquet_path = os.path.splitext(output_path)[0] + ".parquet"
+    clean_df.to_parquet(parquet_path, engine="pyarrow", compression="snappy", index=False)
+    print(f"✓ Saved to: {parquet_path}")
+    print(f"✓ File size: {os.path.getsize(parquet_path) / (1024 * 1024):.2f} MB")
+    
     # Show final sample
     print("\nSample of cleaned data:")
     print("-" * 70)
-    sample = clean_df.sample(min(10, len(clean_df)))
-    for idx, row in sample.iterrows():
-        label_text = "PHISHING  " if row['label'] == 1 else "LEGITIMATE"
-        print(f"[{label_text}] {row['url'][:60]}")
+    sample_idx = np.random.default_rng().choice(len(clean_df), size=min(10, len(clean_df)), replace=False)
+    print("\n".join(
+        f"[{'PHISHING  ' if label == 1 else 'LEGITIMATE'}] {url[:60]}"
+        for url, label in zip(clean_df['url'].to_numpy()[sample_idx], clean_df['label'].to_numpy()[sample_idx])
+    ))
     print()
     
     print("=" * 70)